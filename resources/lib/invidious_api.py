@@ -1,10 +1,24 @@
 import time
 from collections import namedtuple
-from typing import Iterator, Union
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Iterator, Union
+from urllib.parse import urlencode
 
 import requests
+import requests.adapters
 import xbmc
 import xbmcaddon
+from urllib3.util.retry import Retry
+
+try:
+    import orjson as _json
+except ImportError:
+    # orjson is not available on every Kodi platform.
+    import json as _json
+
+# Debug messages logged around every API request.
+_REQUEST_STARTED = "invidious ========== request %s with %s started =========="
+_REQUEST_FINISHED = "invidious ========== request finished in %ss =========="
 
 VideoSearchResult = namedtuple(
     "VideoSearchResult",
@@ -53,17 +67,71 @@ InvidiousApiResponseType = Union[
 ]
 
 
+def make_session() -> requests.Session:
+    """Return a session with a connection pool large enough for the
+    parallel requests done by the plugin, retrying on transient
+    gateway errors."""
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=16,
+        # Only retry gateway errors.  Retrying connects and reads
+        # would multiply the timeouts and turn read timeouts into
+        # ConnectionError.  Hand the last gateway error response back
+        # to raise_for_status() instead of raising RetryError.
+        max_retries=Retry(
+            total=2,
+            connect=0,
+            read=False,
+            backoff_factor=0.3,
+            status_forcelist=[502, 503, 504],
+            raise_on_status=False,
+        ),
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    # These are the requests defaults, set explicitly to keep them.
+    session.headers["Accept-Encoding"] = "gzip, deflate"
+    session.headers["Connection"] = "keep-alive"
+    return session
+
+
+def response_json(response: requests.Response) -> Any:
+    """Parse a JSON response body.
+
+    Unlike response.json(), this parses the raw bytes directly instead
+    of decoding them to a string first.
+    """
+    return _json.loads(response.content)
+
+
 class InvidiousAPIClient:
+    # Number of channels fetched in parallel for the subscription list.
+    # Keep at or below the pool size of the session's HTTPS adapter.
+    SUBSCRIPTION_WORKERS = 8
+
     instance_url: str
+    base_url: str
     session: requests.Session
+    timeout: float
     addon: xbmcaddon.Addon
     authenticated: bool
     username: str | None
     password: str | None
 
-    def __init__(self, instance_url: str, auth: None | dict[str, str] = None):
+    def __init__(
+        self,
+        instance_url: str,
+        auth: None | dict[str, str] = None,
+        session: None | requests.Session = None,
+        timeout: float = 5,
+    ):
         self.instance_url = instance_url.rstrip("/")
-        self.session = requests.Session()
+        self.base_url = self.instance_url + "/api/v1/"
+        # Share the session with the caller when given, to reuse its
+        # pooled keep-alive connections.
+        self.session = session if session is not None else make_session()
+        self.timeout = timeout
         self.authenticated = False
         self.username, self.password = None, None
         if auth:
@@ -71,10 +139,9 @@ class InvidiousAPIClient:
             self.password = auth["password"]
         self.addon = xbmcaddon.Addon()
         self.local = ("true" == self.addon.getSetting("local"))
-
-    @property
-    def base_url(self) -> str:
-        return self.instance_url + "/api/v1/"
+        # Avoid formatting debug messages nobody will see.
+        self.debug = self.addon.getSettingBool("debug_log")
+        self._default_description = self.addon.getLocalizedString(30000)
 
     def _login(self) -> None:
         if not self.username:
@@ -98,20 +165,16 @@ class InvidiousAPIClient:
     ) -> requests.Response:
         assembled_url = self.base_url + path
 
-        xbmc.log(
-            f"invidious ========== request {assembled_url} with {params} started ==========",
-            xbmc.LOGDEBUG,
-        )
+        if self.debug:
+            xbmc.log(_REQUEST_STARTED % (assembled_url, params), xbmc.LOGDEBUG)
         if self.local:
             params["local"] = "true"
 
         start = time.time()
-        response = self.session.get(assembled_url, params=params, timeout=5)
+        response = self.session.get(assembled_url, params=params, timeout=self.timeout)
         end = time.time()
-        xbmc.log(
-            f"invidious ========== request finished in {end - start}s ==========",
-            xbmc.LOGDEBUG,
-        )
+        if self.debug:
+            xbmc.log(_REQUEST_FINISHED % (end - start), xbmc.LOGDEBUG)
 
         if response.status_code > 300:
             xbmc.log(
@@ -127,52 +190,54 @@ class InvidiousAPIClient:
     ) -> Iterator[InvidiousApiResponseType]:
         if not response or not response.content:
             raise StopIteration()
-        data = response.json()
+        data = response_json(response)
 
         # If a channel or playlist is opened, the videos are packaged
         # in a dict entry "videos".
         if "videos" in data:
             data = data["videos"]
 
+        # Look these up once instead of for every item.
+        default_description = self._default_description
+        _Video = VideoSearchResult
+        _Channel = ChannelSearchResult
+        _Playlist = PlaylistSearchResult
+
         for item in data:
             # Playlist videos do not have the 'type' attribute
-            if "type" not in item or item["type"] in ["video", "shortVideo"]:
+            item_type = item.get("type", "video")
+            if item_type in ("video", "shortVideo"):
                 # Skip videos with no or negative duration.
                 if not item["lengthSeconds"] > 0:
                     continue
-                for thumb in item["videoThumbnails"]:
-
-                    # high appears to be ~480x360, which is a
-                    # reasonable trade-off works well on 1080p.
-                    if thumb["quality"] == "high":
-                        thumbnail_url = thumb["url"]
-                        break
-
-                # as a fallback, we just use the last one in the list
-                # (which is usually the lowest quality).
-                else:
-                    thumbnail_url = item["videoThumbnails"][-1]["url"]
-                yield VideoSearchResult(
+                # high appears to be ~480x360, which is a reasonable
+                # trade-off works well on 1080p.  As a fallback, we
+                # just use the last one in the list (which is usually
+                # the lowest quality).
+                thumbnails = item["videoThumbnails"]
+                thumbnail_url = next(
+                    (thumb["url"] for thumb in thumbnails if thumb["quality"] == "high"),
+                    thumbnails[-1]["url"],
+                )
+                yield _Video(
                     "video",
                     item["videoId"],
                     thumbnail_url,
                     item["title"],
                     item["author"],
-                    item.get("description", self.addon.getLocalizedString(30000)),
+                    item.get("description") or default_description,
                     item.get("viewCount", -1),  # Missing for playlists.
                     item.get("published", 0),  # Missing for playlists.
                     item["lengthSeconds"],
                 )
-            elif item["type"] == "channel":
+            elif item_type == "channel":
                 # Grab the highest resolution avatar image
                 # Usually isn't more than 512x512
-                thumbnail = sorted(
-                    item["authorThumbnails"],
-                    key=lambda thumb: thumb["height"],
-                    reverse=True,
-                )[0]
+                thumbnail = max(
+                    item["authorThumbnails"], key=lambda thumb: thumb["height"]
+                )
 
-                yield ChannelSearchResult(
+                yield _Channel(
                     "channel",
                     item["authorId"],
                     "https:" + thumbnail["url"],
@@ -181,8 +246,8 @@ class InvidiousAPIClient:
                     item["authorVerified"],
                     item["subCount"],
                 )
-            elif item["type"] == "playlist":
-                yield PlaylistSearchResult(
+            elif item_type == "playlist":
+                yield _Playlist(
                     "playlist",
                     item["playlistId"],
                     item["playlistThumbnail"],
@@ -194,7 +259,7 @@ class InvidiousAPIClient:
                 )
             else:
                 xbmc.log(
-                    f'invidious received search result item with unknown response type {item["type"]}.',
+                    f'invidious received search result item with unknown response type {item_type}.',
                     xbmc.LOGWARNING,
                 )
 
@@ -211,7 +276,16 @@ class InvidiousAPIClient:
     def fetch_video_information(self, video_id):
         response = self._make_get_request(f"videos/{video_id}")
 
-        return response.json()
+        return response_json(response)
+
+    def video_stream_url(self, video_id: str, itag: int = 18) -> str:
+        """Return a URL redirecting to a non-DASH stream of the video,
+        without fetching the video information first.  itag 18 is the
+        360p MP4 stream most videos have."""
+        params = {"id": video_id, "itag": itag}
+        if self.local:
+            params["local"] = "true"
+        return f"{self.instance_url}/latest_version?{urlencode(params)}"
 
     def fetch_channel_list(self, channel_id):
         response = self._make_get_request(f"channels/{channel_id}/videos")
@@ -237,24 +311,24 @@ class InvidiousAPIClient:
             if isinstance(result, VideoSearchResult):
                 yield result
 
-    def fetch_subscribed_channels(self) -> Iterator[ChannelSearchResult]:
+    def fetch_subscribed_channels(self) -> list[ChannelSearchResult]:
         if not self.authenticated:
             self._login()
         subscriptions_response = self._make_get_request("auth/subscriptions")
 
-        data = subscriptions_response.json()
-        for author in data:
-            yield self.fetch_channel_info(author["authorId"])
+        data = response_json(subscriptions_response)
+        with ThreadPoolExecutor(max_workers=self.SUBSCRIPTION_WORKERS) as executor:
+            return list(
+                executor.map(
+                    self.fetch_channel_info, [author["authorId"] for author in data]
+                )
+            )
 
     def fetch_channel_info(self, channel_id: str) -> ChannelSearchResult:
         response = self._make_get_request(f"channels/{channel_id}")
 
-        data = response.json()
-        thumbnail = sorted(
-            data["authorThumbnails"],
-            key=lambda thumb: thumb["height"],
-            reverse=True,
-        )[0]
+        data = response_json(response)
+        thumbnail = max(data["authorThumbnails"], key=lambda thumb: thumb["height"])
 
         return ChannelSearchResult(
             "channel",
@@ -1,7 +1,8 @@
-import json
+import functools
 import os
 import sys
-from datetime import datetime
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
 from typing import Any, Iterator
 from urllib.parse import parse_qs, urlencode
 
@@ -15,26 +16,67 @@ import xbmcplugin
 import xbmcvfs
 from infotagger.listitem import ListItemInfoTag
 
+try:
+    import orjson as _json
+except ImportError:
+    # orjson is not available on every Kodi platform.
+    import json as _json
+
+
+@functools.lru_cache(maxsize=128)
+def _format_day(day: int) -> str:
+    return time.strftime("%Y-%m-%d", time.gmtime(day * 86400))
+
+
+def format_date(timestamp: int) -> str:
+    """Return the UTC date of a POSIX timestamp as YYYY-MM-DD."""
+    # Many videos in a listing share the upload date, so cache per day.
+    return _format_day(int(timestamp) // 86400)
+
+
+def write_json_file(path: str, value: Any):
+    """Write value as JSON to path, replacing the file atomically."""
+    data = _json.dumps(value)
+    if isinstance(data, str):
+        # stdlib json returns str, orjson returns bytes
+        data = data.encode("utf-8")
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as file:
+        file.write(data)
+    os.replace(tmp_path, path)
+
 
 class SearchHistory:
     """Keep fixed length list of search queries, with the latest search
     query top."""
 
-    def __init__(self, history_path: str, depth: int = 10):
+    def __init__(self, history_path: str, depth: int = 10, debug: bool = False):
         self.history_path = history_path
         self.depth = depth
+        self.debug = debug
+        self._queries: list[str] | None = None
 
         d = os.path.dirname(history_path)
         if not os.path.exists(d):
-            xbmc.log(f"invidous created state directory {d}.", xbmc.LOGDEBUG)
+            if self.debug:
+                xbmc.log(f"invidous created state directory {d}.", xbmc.LOGDEBUG)
             os.mkdir(d)
 
+    def _load(self) -> list[str]:
+        if self._queries is None:
+            try:
+                with open(self.history_path, "rb") as file:
+                    self._queries = _json.loads(file.read())
+            except FileNotFoundError:
+                self._queries = []
+        return self._queries
+
     def push(self, query: str):
-        if xbmcvfs.exists(self.history_path):
-            with open(self.history_path, "r") as file:
-                queries = json.load(file)
-        else:
-            queries = []
+        queries = self._load()
+
+        if queries and queries[0] == query:
+            # Already the latest search, nothing to write.
+            return
 
         if query in queries:
             # Remove existing entry to move it forward
@@ -42,39 +84,60 @@ class SearchHistory:
 
         queries.insert(0, query)
 
-        queries = queries[: self.depth]
+        del queries[self.depth :]
 
-        with open(self.history_path, "w+") as file:
-            json.dump(queries, file)
+        write_json_file(self.history_path, queries)
 
     def queries(self):
-        if not xbmcvfs.exists(self.history_path):
-            return []
-        with open(self.history_path, "r") as file:
-            return json.load(file)
+        return list(self._load())
 
 
 class InvidiousPlugin:
 
     INSTANCESURL = "https://api.invidious.io/instances.json?sort_by=type,health"
+    # Number of instances probed in parallel during autodetection.
+    AUTODETECT_PROBES = 8
+    # Seconds to wait for higher ranked instances after the first
+    # working one answered.
+    AUTODETECT_GRACE = 0.5
+    # Seconds a probe may take.  Probes that lost still run to the end
+    # when autodetection returns, and the plugin cannot exit before
+    # they do, so keep this short.
+    AUTODETECT_TIMEOUT = 3
+    # Seconds an autodetected instance is reused without probing.
+    INSTANCE_CACHE_TTL = 3600
 
     def __init__(self, base_url: str, addon_handle: int, args: dict[str, Any]):
         self.base_url = base_url
         self.addon_handle = addon_handle
         self.addon = xbmcaddon.Addon()
         self.args = args
+        settings = self.addon.getSettings()
+        # Avoid formatting debug messages nobody will see.
+        self.debug = settings.getBool("debug_log")
+
         path = xbmcvfs.translatePath(self.addon.getAddonInfo("profile"))
-        self.search_history = SearchHistory(path + "search-history.json", 20)
+        self.search_history = SearchHistory(
+            path + "search-history.json", 20, debug=self.debug
+        )
+        self.instance_cache_path = path + "instance-cache.json"
+
+        # One session for instance probing and all API calls, to avoid
+        # a new TCP and TLS handshake for every request.
+        self._session = invidious_api.make_session()
 
-        settings = self.addon.getSettings()
         self.auto_instance = settings.getBool("auto_instance")
         instance_auth = None
-        if self.auto_instance and not settings.getString("instance_url"):
-            instance_url = self.instance_autodetect()
-            self.addon.setSetting("instance_url", instance_url)
+        if self.auto_instance:
+            # Use the picked instance without checking it, until an
+            # error in run() invalidates it.
+            instance_url = settings.getString("instance_url")
+            if not instance_url:
+                instance_url = self.instance_autodetect()
+                self.addon.setSetting("instance_url", instance_url)
         else:
             instance_url = self.addon.getSetting("instance_url")
-            if settings.getString("instance_username") and not self.auto_instance:
+            if settings.getString("instance_username"):
                 instance_auth = {
                     "username": settings.getString("instance_username"),
                     "password": settings.getString("instance_password"),
@@ -82,39 +145,46 @@ class InvidiousPlugin:
 
         xbmc.log(f"invidous using instance {instance_url}.", xbmc.LOGINFO)
         self.api_client = invidious_api.InvidiousAPIClient(
-            instance_url, auth=instance_auth
+            instance_url, auth=instance_auth, session=self._session
         )
         self.disable_dash = settings.getBool("disable_dash")
+        # Only used without DASH, as DASH needs the video information.
+        self.quick_play = self.disable_dash and settings.getBool("quick_play")
         self.show_instance_trending = settings.getBool("show_instance_trending")
         self.show_instance_popular = settings.getBool("show_instance_popular")
+        self.mark_items_watched = settings.getBool("mark_items_watched")
 
     def instance_autodetect(self):
         xbmc.log("invidious picking instance automatically.", xbmc.LOGINFO)
 
-        response = requests.get(self.INSTANCESURL, timeout=5)
-        data = response.json()
+        instance_url = self.cached_instance()
+        if instance_url:
+            xbmc.log(f"invidious reusing cached instance {instance_url}.", xbmc.LOGINFO)
+            return instance_url
+
+        # The instance list is large.  It is parsed straight from the
+        # response bytes, and skipped entirely while the cached
+        # instance is fresh.  Streaming the body would not help, as
+        # the JSON parser needs all of it anyway.
+        response = self._session.get(self.INSTANCESURL, timeout=5)
+        data = invidious_api.response_json(response)
+        candidates = []
         for instanceinfo in data:
-            xbmc.log(
-                "invidious considering instance " + str(instanceinfo), xbmc.LOGDEBUG
-            )
+            if self.debug:
+                xbmc.log(
+                    "invidious considering instance " + str(instanceinfo),
+                    xbmc.LOGDEBUG,
+                )
             instancename, instance = instanceinfo
             if "https" == instance["type"] and instance["api"] is not False:
-                instance_url = instance["uri"]
-                # Make sure the instance work for us.  This test avoid
-                # those rejecting us with HTTP status 429.  Some
-                # instances return a sensible value for the special
-                # lists but not for an individual video, so test with
-                # a fairly randomly picked video id to avoid partly
-                # working instances.
-                test_video_id = "1l2_uCyBXQ0"
-                api_client = invidious_api.InvidiousAPIClient(instance_url)
-                try:
-                    api_client.fetch_video_information(test_video_id)
-                    return instance_url
-                except Exception:
-                    xbmc.log(
-                        f"rejecting non-working instance {instanceinfo}", xbmc.LOGDEBUG
-                    )
+                candidates.append(instance["uri"])
+                if len(candidates) >= self.AUTODETECT_PROBES:
+                    break
+
+        instance_url = self._probe_instances(candidates)
+        if instance_url:
+            self.store_cached_instance(instance_url)
+            return instance_url
 
         xbmc.log(
             "invidious no working https type instance with API support returned from api.invidious.io.",
@@ -129,6 +199,88 @@ class InvidiousPlugin:
         )
         raise ValueError("unable to find working Invidious instance")
 
+    def cached_instance(self) -> str | None:
+        """Return the last autodetected instance if it is recent,
+        otherwise None."""
+        try:
+            with open(self.instance_cache_path, "rb") as file:
+                cache = _json.loads(file.read())
+        except (OSError, ValueError):
+            return None
+        if time.time() - cache.get("ts", 0) >= self.INSTANCE_CACHE_TTL:
+            return None
+        return cache.get("url")
+
+    def store_cached_instance(self, instance_url: str):
+        write_json_file(
+            self.instance_cache_path, {"url": instance_url, "ts": time.time()}
+        )
+
+    def invalidate_cached_instance(self):
+        """Make the next start pick a new instance, if the instance
+        is picked automatically."""
+        if not self.auto_instance:
+            return
+        xbmc.log("invidious dropping automatically picked instance.", xbmc.LOGINFO)
+        self.addon.setSetting("instance_url", "")
+        try:
+            os.remove(self.instance_cache_path)
+        except FileNotFoundError:
+            pass
+
+    def _probe_instance(self, instance_url: str) -> str:
+        # Make sure the instance work for us.  This test avoid those
+        # rejecting us with HTTP status 429.  Some instances return a
+        # sensible value for the special lists but not for an
+        # individual video, so test with a fairly randomly picked
+        # video id to avoid partly working instances.
+        test_video_id = "1l2_uCyBXQ0"
+        api_client = invidious_api.InvidiousAPIClient(
+            instance_url, session=self._session, timeout=self.AUTODETECT_TIMEOUT
+        )
+        api_client.fetch_video_information(test_video_id)
+        return instance_url
+
+    def _probe_instances(self, candidates: list[str]) -> str | None:
+        """Probe the candidate instances in parallel and return the
+        highest ranked one found working, or None."""
+        if not candidates:
+            return None
+
+        executor = ThreadPoolExecutor(max_workers=len(candidates))
+        futures = {
+            executor.submit(self._probe_instance, instance_url): index
+            for index, instance_url in enumerate(candidates)
+        }
+        try:
+            first = None
+            for future in as_completed(futures):
+                if future.exception() is None:
+                    first = futures[future]
+                    break
+                if self.debug:
+                    xbmc.log(
+                        f"rejecting non-working instance {candidates[futures[future]]}",
+                        xbmc.LOGDEBUG,
+                    )
+            if first is None:
+                return None
+
+            # Keep the api.invidious.io ranking if a higher ranked
+            # instance answers shortly after.
+            earlier = sorted(
+                (f for f, index in futures.items() if index < first), key=futures.get
+            )
+            wait(earlier, timeout=self.AUTODETECT_GRACE)
+            for future in earlier:
+                if future.done() and future.exception() is None:
+                    return future.result()
+            return candidates[first]
+        finally:
+            # All probes are already running, so this cancels nothing,
+            # but avoids blocking here until the losing probes finish.
+            executor.shutdown(wait=False)
+
     def build_url(self, action, **kwargs):
         if not action:
             raise ValueError("you need to specify an action")
@@ -140,16 +292,80 @@ class InvidiousPlugin:
     def add_directory_item(self, *args, **kwargs):
         xbmcplugin.addDirectoryItem(self.addon_handle, *args, **kwargs)
 
+    def add_directory_items(self, items):
+        xbmcplugin.addDirectoryItems(self.addon_handle, items, len(items))
+
     def end_of_directory(self):
         xbmcplugin.endOfDirectory(self.addon_handle)
 
+    def _video_item(self, result, list_item):
+        datestr = format_date(result.published)
+
+        info_tag = ListItemInfoTag(list_item, "video")
+        info_tag.set_info(
+            {
+                "title": result.heading,
+                "mediatype": "video",
+                "plot": result.description,
+                "credits": result.author,
+                "date": datestr,
+                "dateadded": datestr,
+                "premiered": datestr,
+                "duration": result.duration,
+            }
+        )
+
+        if not self.quick_play:
+            return self.build_url("play_video", video_id=result.id), False
+
+        # Pass along what play_video needs, so it can skip fetching
+        # the video information.
+        url = self.build_url(
+            "play_video",
+            video_id=result.id,
+            title=result.heading,
+            author=result.author,
+            description=result.description,
+            published=result.published,
+            duration=result.duration,
+        )
+        return url, False
+
+    def _channel_item(self, result, list_item):
+        info_tag = ListItemInfoTag(list_item, "video")
+        info_tag.set_info(
+            {
+                "title": result.heading,
+                "plot": result.description,
+            }
+        )
+        return self.build_url("view_channel", channel_id=result.id), True
+
+    def _playlist_item(self, result, list_item):
+        return self.build_url("view_playlist", playlist_id=result.id), True
+
     def display_search_results(
         self, results: Iterator[invidious_api.InvidiousApiResponseType]
     ):
+        # Each handler fills in list_item and returns (url, isFolder).
+        handlers = {
+            invidious_api.VideoSearchResult: self._video_item,
+            invidious_api.ChannelSearchResult: self._channel_item,
+            invidious_api.PlaylistSearchResult: self._playlist_item,
+        }
+
         # FIXME Add pagination support?
+        # Collect (url, listitem, isFolder) and hand them to Kodi in
+        # one call.
+        items = []
         for result in results:
-            if result.type not in ["video", "channel", "playlist"]:
-                raise RuntimeError("unknown result type " + result.type)
+            handler = handlers.get(type(result))
+            if handler is None:
+                xbmc.log(
+                    f"invidious skipping result of unknown type {type(result)}.",
+                    xbmc.LOGWARNING,
+                )
+                continue
 
             list_item = xbmcgui.ListItem(result.heading)
             list_item.setArt(
@@ -162,39 +378,10 @@ class InvidiousPlugin:
             # seriously, Kodi? come on...
             # https://forum.kodi.tv/showthread.php?tid=173986&pid=1519987#pid1519987
             list_item.setProperty("IsPlayable", "true")
-            if isinstance(result, invidious_api.VideoSearchResult):
-                datestr = datetime.utcfromtimestamp(result.published).date().isoformat()
-
-                info_tag = ListItemInfoTag(list_item, "video")
-                info_tag.set_info(
-                    {
-                        "title": result.heading,
-                        "mediatype": "video",
-                        "plot": result.description,
-                        "credits": result.author,
-                        "date": datestr,
-                        "dateadded": datestr,
-                        "premiered": datestr,
-                        "duration": result.duration,
-                    }
-                )
-
-                url = self.build_url("play_video", video_id=result.id)
-                self.add_directory_item(url=url, listitem=list_item)
-            elif isinstance(result, invidious_api.ChannelSearchResult):
-                url = self.build_url("view_channel", channel_id=result.id)
-                info_tag = ListItemInfoTag(list_item, "video")
-                info_tag.set_info(
-                    {
-                        "title": result.heading,
-                        "plot": result.description,
-                    }
-                )
-                self.add_directory_item(url=url, listitem=list_item, isFolder=True)
-            elif isinstance(result, invidious_api.PlaylistSearchResult):
-                url = self.build_url("view_playlist", playlist_id=result.id)
-                self.add_directory_item(url=url, listitem=list_item, isFolder=True)
+            url, is_folder = handler(result, list_item)
+            items.append((url, list_item, is_folder))
 
+        self.add_directory_items(items)
         self.end_of_directory()
 
     def display_new_search(self):
@@ -212,7 +399,8 @@ class InvidiousPlugin:
 
         self.search_history.push(search_input)
 
-        xbmc.log(f"invidious searching for {search_input}.", xbmc.LOGDEBUG)
+        if self.debug:
+            xbmc.log(f"invidious searching for {search_input}.", xbmc.LOGDEBUG)
 
         # pass search query to Invidious
         results = self.api_client.search(search_input)
@@ -230,27 +418,42 @@ class InvidiousPlugin:
 
         self.display_search_results(videos)
 
-    def play_video(self, id):
-        # TODO: add support for adaptive streaming
-        video_info = self.api_client.fetch_video_information(id)
+    def play_video(self, id, known_info=None):
+        listitem = None
+        if self.quick_play and known_info:
+            # The listing already provided the metadata and the stream
+            # is reachable through a redirect, so there is no need to
+            # fetch the video information.  This is opt-in, as the
+            # redirect fails for videos without the itag 18 stream.
+            video_info = known_info
+            url = self.api_client.video_stream_url(id)
+            if self.debug:
+                xbmc.log(f"invidious playing non-dash stream {url}.", xbmc.LOGDEBUG)
+            listitem = xbmcgui.ListItem(path=url)
+        else:
+            # TODO: add support for adaptive streaming
+            video_info = self.api_client.fetch_video_information(id)
 
-        xbmc.log(f"invidious playing video {video_info}.", xbmc.LOGDEBUG)
+        if self.debug:
+            xbmc.log(f"invidious playing video {video_info}.", xbmc.LOGDEBUG)
 
-        listitem = None
         # check if playback via MPEG-DASH is possible
-        if not self.disable_dash and "dashUrl" in video_info:
+        if listitem is None and not self.disable_dash and "dashUrl" in video_info:
             is_helper = inputstreamhelper.Helper("mpd")
 
             if is_helper.check_inputstream():
                 url = video_info["dashUrl"]
-                xbmc.log(f"invidious using mpeg-dash stream {url}.", xbmc.LOGDEBUG)
+                if self.debug:
+                    xbmc.log(f"invidious using mpeg-dash stream {url}.", xbmc.LOGDEBUG)
                 listitem = xbmcgui.ListItem(path=url)
                 listitem.setProperty("inputstream", is_helper.inputstream_addon)
                 listitem.setProperty("inputstream.adaptive.manifest_type", "mpd")
             else:
-                xbmc.log(
-                    "invidious mpeg-dash input helper not available.", xbmc.LOGDEBUG
-                )
+                if self.debug:
+                    xbmc.log(
+                        "invidious mpeg-dash input helper not available.",
+                        xbmc.LOGDEBUG,
+                    )
 
         # as a fallback, we use the last oldschool stream, as it is
         # often the best quality.
@@ -263,7 +466,7 @@ class InvidiousPlugin:
             # it's pretty complicated to play a video by its URL in Kodi...
             listitem = xbmcgui.ListItem(path=url)
 
-        datestr = datetime.utcfromtimestamp(video_info["published"]).date().isoformat()
+        datestr = format_date(video_info["published"])
         info_tag = ListItemInfoTag(listitem, "video")
         info_tag.set_info(
             {
@@ -278,7 +481,7 @@ class InvidiousPlugin:
             }
         )
 
-        if self.addon.getSettingBool("mark_items_watched") and self.api_client.username:
+        if self.mark_items_watched and self.api_client.username:
             try:
                 self.api_client.mark_watched(id)
             except Exception as e:
@@ -294,6 +497,26 @@ class InvidiousPlugin:
         else:
             xbmc.Player().play(url, listitem)
 
+    def known_video_info(self):
+        """Return the video metadata passed along in the play_video URL
+        in the layout of fetch_video_information(), or None."""
+        try:
+            video_info = {
+                "title": self.args["title"][0],
+                "author": self.args["author"][0],
+                # parse_qs() drops empty values.
+                "description": self.args.get("description", [""])[0],
+                "published": int(self.args["published"][0]),
+                "lengthSeconds": int(self.args["duration"][0]),
+            }
+        except (KeyError, ValueError):
+            return None
+        # Playlist entries lack the publish time and get 0, fetch the
+        # real date instead of showing 1970-01-01.
+        if not video_info["published"]:
+            return None
+        return video_info
+
     def display_main_menu(self):
         def add_list_item(label, path):
             listitem = xbmcgui.ListItem(
@@ -351,12 +574,13 @@ class InvidiousPlugin:
         action = self.args.get("action", [None])[0]
 
         # debugging
-        xbmc.log("invidous --------------------------------------------", xbmc.LOGDEBUG)
-        xbmc.log("invidous base url:" + str(self.base_url), xbmc.LOGDEBUG)
-        xbmc.log("invidous handle:" + str(self.addon_handle), xbmc.LOGDEBUG)
-        xbmc.log("invidous args:" + str(self.args), xbmc.LOGDEBUG)
-        xbmc.log("invidous action:" + str(action), xbmc.LOGDEBUG)
-        xbmc.log("invidous --------------------------------------------", xbmc.LOGDEBUG)
+        if self.debug:
+            xbmc.log("invidous --------------------------------------------", xbmc.LOGDEBUG)
+            xbmc.log("invidous base url:" + str(self.base_url), xbmc.LOGDEBUG)
+            xbmc.log("invidous handle:" + str(self.addon_handle), xbmc.LOGDEBUG)
+            xbmc.log("invidous args:" + str(self.args), xbmc.LOGDEBUG)
+            xbmc.log("invidous action:" + str(action), xbmc.LOGDEBUG)
+            xbmc.log("invidous --------------------------------------------", xbmc.LOGDEBUG)
 
         # for the sake of simplicity, we just handle HTTP request errors here centrally
         try:
@@ -373,7 +597,7 @@ class InvidiousPlugin:
                 self.display_search_result(self.args["q"][0])
 
             elif action == "play_video":
-                self.play_video(self.args["video_id"][0])
+                self.play_video(self.args["video_id"][0], self.known_video_info())
 
             elif action == "view_channel":
                 self.display_channel_list(self.args["channel_id"][0])
@@ -394,6 +618,10 @@ class InvidiousPlugin:
                 raise RuntimeError("unknown action " + action)
 
         except requests.HTTPError as e:
+            # Client errors like a missing video or failed login do
+            # not mean the instance is broken.
+            if e.response.status_code >= 500:
+                self.invalidate_cached_instance()
             xbmc.log(
                 f"invidous HTTP status {e.response.status_code} during action processing: {e.response.reason}",
                 xbmc.LOGWARNING,
@@ -406,6 +634,7 @@ class InvidiousPlugin:
             )
 
         except requests.Timeout:
+            self.invalidate_cached_instance()
             xbmc.log(
                 "invidous HTTP timed out during action processing", xbmc.LOGWARNING
             )
@@ -416,6 +645,10 @@ class InvidiousPlugin:
                 "error",
             )
 
+        except requests.ConnectionError:
+            self.invalidate_cached_instance()
+            raise
+
     @classmethod
     def from_argv(cls):
         base_url = sys.argv[0]